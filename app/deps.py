@@ -0,0 +1,10 @@
+# app/deps.py
+from __future__ import annotations
+
+from fastapi import Header
+
+
+# Shared by every router. Kept async: FastAPI awaits an async dependency
+# inline, whereas a plain def would be sent through the threadpool.
+async def get_user_id(x_user_id: str = Header(..., alias="X-User-ID")) -> str:
+    return x_user_id
@@ -1,64 +1,120 @@
 # instanseg_tasks.py
 from __future__ import annotations
 import asyncio
+import functools
+import json
 import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Tuple
 
+import aiofiles
 import numpy as np
 import openslide
-from PIL import Image, ImageDraw
+import torch
+import torch.nn.functional as F
+from PIL import Image
 
 
-from skimage.color import rgb2gray
-from skimage.filters import threshold_otsu
-from skimage.measure import regionprops
+from scipy import ndimage
 
 from instanseg import InstanSeg
+from instanseg.utils.utils import percentile_normalize
 
 from app.models import JobInternal, JobType
 from app.utils.progress import update_job_progress
-from app.utils.tiles import compute_tile_grid
-from app.utils.storage import get_job_output_dir, save_segmentation_result
+from app.utils.raster import rasterize_boxes, tint_red
+from app.utils.tiles import compute_tile_grid, compute_tissue_mask, morton_order, tile_coverage
+from app.utils.storage import job_output_dir, save_segmentation_result
 
 Image.MAX_IMAGE_PIXELS = None
 # ============================================================
 #   GLOBAL INSTANSEG MODEL
 # ============================================================
 
-_instanseg_model: InstanSeg | None = None
-_model_lock = asyncio.Lock()
+class _Replica:
+    """
+    One InstanSeg model on one device. `gpu` makes the replica a single GPU
+    user: batches from every job queue up on it instead of contending for
+    the same device. `stager` owns the pinned upload buffer for the device.
+    """
 
-async def get_instanseg_model() -> InstanSeg:
-    global _instanseg_model
-    if _instanseg_model is not None:
-        return _instanseg_model
+    def __init__(self, model: InstanSeg) -> None:
+        self.model = model
+        self.gpu = asyncio.Semaphore(1)
+        self.stager = _TileStager(torch.device(model.inference_device))
+
+
+# One replica per CUDA device, or a single replica on whatever InstanSeg
+# picks when there is no GPU.
+_instanseg_replicas: List[_Replica] = []
+_model_lock = asyncio.Lock()   # held only while the replicas are loading
+_models_ready = asyncio.Event()
+
+async def get_instanseg_replicas() -> List[_Replica]:
+    # Fast path after startup: a flag check, no lock
+    if _models_ready.is_set():
+        return _instanseg_replicas
 
     async with _model_lock:
-        if _instanseg_model is None:
+        if not _models_ready.is_set():
             def _init():
+                devices = [f"cuda:{i}" for i in range(torch.cuda.device_count())] or [None]
                 # Recommended MPP (0.5) from tutorial
-                return InstanSeg(
-                    "brightfield_nuclei",
-                    verbosity=0
-                )
-            _instanseg_model = await asyncio.to_thread(_init)
+                return [
+                    InstanSeg(
+                        "brightfield_nuclei",
+                        device=device,
+                        verbosity=0
+                    )
+                    for device in devices
+                ]
+            models = await asyncio.to_thread(_init)
+            _instanseg_replicas.extend(_Replica(m) for m in models)
+            _models_ready.set()
 
-    return _instanseg_model
+    return _instanseg_replicas
 
 
 # ============================================================
 #   LOW-RES WSI PYRAMID LOADER (perfect alignment)
 # ============================================================
 
-def load_lowres_wsi(slide: openslide.OpenSlide):
-    level = slide.level_count - 1
-    lw, lh = slide.level_dimensions[level]
-
-    lowres = slide.read_region((0, 0), level, (lw, lh)).convert("RGB")
-
-    full_w, full_h = slide.dimensions
-    sx = lw / full_w
-    sy = lh / full_h
+@functools.lru_cache(maxsize=8)
+def _load_lowres_cached(
+    wsi_path: str, mtime: float, use_thumbnail: bool
+) -> Tuple[bytes, int, int, float, float]:
+    """
+    Decode the low-res view of a slide once per (path, mtime) and keep it as
+    raw RGB bytes, shared by every job on the same file. This is the
+    coarsest pyramid level; with `use_thumbnail` the slide's stored
+    thumbnail is used instead when it has one (its size is vendor-specific).
+    """
+    slide = openslide.OpenSlide(wsi_path)
+    try:
+        thumbnail = slide.associated_images.get("thumbnail") if use_thumbnail else None
+        if thumbnail is not None:
+            lowres = thumbnail.convert("RGB")
+        else:
+            level = slide.level_count - 1
+            lw, lh = slide.level_dimensions[level]
+            lowres = slide.read_region((0, 0), level, (lw, lh)).convert("RGB")
+        full_w, full_h = slide.dimensions
+    finally:
+        slide.close()
+
+    lw, lh = lowres.size
+    return lowres.tobytes(), lw, lh, lw / full_w, lh / full_h
+
+
+def load_lowres_wsi(wsi_path: str, use_thumbnail: bool = False):
+    # Blocks on OpenSlide; call from async code via asyncio.to_thread.
+    # mtime is part of the cache key so a replaced file is re-read
+    buf, lw, lh, sx, sy = _load_lowres_cached(
+        wsi_path, os.stat(wsi_path).st_mtime, use_thumbnail
+    )
+    lowres = Image.frombuffer("RGB", (lw, lh), buf, "raw", "RGB", 0, 1)
 
     return lowres, lw, lh, sx, sy
 
@@ -67,56 +123,391 @@ def load_lowres_wsi(slide: openslide.OpenSlide):
 #   TILE-LEVEL INSTANSEG INFERENCE
 # ============================================================
 
-async def _segment_tile(
+# Default prefetch depth between pipeline stages (decode -> GPU -> regionprops)
+PIPELINE_DEPTH = 4
+# Default number of tiles stacked into one InstanSeg forward pass
+BATCH_SIZE = 8
+# Run InstanSeg under FP16 autocast on CUDA (off: FP32 everywhere)
+HALF_PRECISION = True
+# Opt-in: autocast to BF16 instead where the GPU supports it. Off until its
+# labels have been checked against FP32 on a holdout slide
+PREFER_BF16 = False
+# Inference workers per replica: one runs on the GPU while the other
+# stages its next batch, so uploads overlap compute
+WORKERS_PER_REPLICA = 2
+# Default minimum tissue fraction for a tile to be segmented
+MIN_TISSUE_FRACTION = 0.05
+# Default number of threads decoding tiles ahead of the GPU; OpenSlide
+# releases the GIL while decoding, so reads run in parallel
+IO_WORKERS = 4
+
+_PIPELINE_DONE = None  # end-of-stream marker passed through the queues
+
+
+def _read_tile(slide: openslide.OpenSlide, tile_box: Tuple[int, int, int, int]) -> np.ndarray:
+    x, y, w, h = tile_box
+    # Drop alpha by slicing OpenSlide's RGBA buffer; a PIL convert("RGB")
+    # would allocate and fill a second image. Overlap strips are re-read
+    # from OpenSlide's own decoded-tile cache, so no region cache here.
+    rgba = slide.read_region((x, y), 0, (w, h))
+    return np.frombuffer(rgba.tobytes(), dtype=np.uint8).reshape(h, w, 4)[:, :, :3]
+
+
+# Per-thread scratch space for label images that need an argmax
+_scratch = threading.local()
+
+
+def _argmax_buffer(shape: Tuple[int, ...]) -> np.ndarray:
+    buf = getattr(_scratch, "argmax", None)
+    if buf is None or buf.shape != shape:
+        buf = np.empty(shape, dtype=np.intp)
+        _scratch.argmax = buf
+    return buf
+
+
+def _to_label_image(output: Any) -> np.ndarray:
+    """
+    Turn raw InstanSeg output for one tile into a 2-D integer label image
+    without copying when it already is one. The result may be a per-thread
+    scratch buffer, so consume it before converting the next tile.
+    """
+    # tensor → numpy
+    mask = output.detach().cpu().numpy() if hasattr(output, "detach") \
+        else np.asarray(output)
+
+    # Squeeze leading singleton axes in one go (spatial axes are kept)
+    lead = 0
+    while lead < mask.ndim - 2 and mask.shape[lead] == 1:
+        lead += 1
+    if lead:
+        mask = np.squeeze(mask, axis=tuple(range(lead)))
+
+    if mask.ndim == 3:
+        mask = np.argmax(mask, axis=-1, out=_argmax_buffer(mask.shape[:-1]))
+
+    if mask.dtype.kind not in "iu":
+        mask = mask.astype(np.int32, copy=False)
+
+    return mask
+
+
+def _half_dtype(device: torch.device) -> torch.dtype | None:
+    """Autocast dtype for inference on `device`, or None for FP32."""
+    if not HALF_PRECISION or device.type != "cuda":
+        return None
+    if PREFER_BF16 and torch.cuda.is_bf16_supported():
+        return torch.bfloat16
+    return torch.float16
+
+
+class _TileStager:
+    """
+    Uploads tile batches to one device through a reusable pinned host
+    buffer. Copies are issued with non_blocking=True on a side CUDA stream,
+    so one batch uploads while the previous one is still computing. The
+    buffer alternates between slots, and a slot is only rewritten once the
+    event recorded after its last copy has fired.
+
+    Off CUDA there is nothing to overlap; each batch gets a fresh tensor.
+    """
+
+    SLOTS = 2
+
+    def __init__(self, device: torch.device) -> None:
+        self.device = device
+        self.cuda = device.type == "cuda"
+        self.stream = torch.cuda.Stream(device) if self.cuda else None
+        self._buffer: torch.Tensor | None = None   # (SLOTS, capacity) uint8, pinned
+        self._events: List[Any] = [None] * self.SLOTS
+        self._slot = 0
+        self._lock = threading.Lock()
+
+    def _host_slot(self, shape: Tuple[int, int, int, int]) -> torch.Tensor:
+        nbytes = int(np.prod(shape))
+        if self._buffer is None or self._buffer.shape[1] < nbytes:
+            # Let in-flight copies out of the old buffer finish before dropping it
+            for event in self._events:
+                if event is not None:
+                    event.synchronize()
+            self._buffer = torch.empty((self.SLOTS, nbytes), dtype=torch.uint8, pin_memory=True)
+            self._events = [None] * self.SLOTS
+
+        event = self._events[self._slot]
+        if event is not None:
+            event.synchronize()
+        # Contiguous view, so the copy below stays a single async DMA
+        return self._buffer[self._slot, :nbytes].view(shape)
+
+    def upload(self, tiles_np: List[np.ndarray]) -> Tuple[torch.Tensor, Any]:
+        """
+        Stack tiles into an (B, H, W, 3) uint8 tensor on the device, padding
+        edge tiles with white background. Returns the tensor and the event
+        that marks its copy as done (None off CUDA).
+        """
+        bh = max(t.shape[0] for t in tiles_np)
+        bw = max(t.shape[1] for t in tiles_np)
+        shape = (len(tiles_np), bh, bw, 3)
+        padded = any(t.shape[:2] != (bh, bw) for t in tiles_np)
+
+        def _fill(host: np.ndarray) -> None:
+            if padded:
+                host.fill(255)
+            for i, t in enumerate(tiles_np):
+                host[i, :t.shape[0], :t.shape[1]] = t
+
+        if not self.cuda:
+            host = torch.empty(shape, dtype=torch.uint8)
+            _fill(host.numpy())
+            return host.to(self.device), None
+
+        with self._lock:
+            host = self._host_slot(shape)
+            _fill(host.numpy())
+            with torch.cuda.stream(self.stream):
+                batch = host.to(self.device, non_blocking=True)
+                event = torch.cuda.Event()
+                event.record(self.stream)
+            self._events[self._slot] = event
+            self._slot = (self._slot + 1) % self.SLOTS
+        return batch, event
+
+
+def _segment_tile_batch(
     model: InstanSeg,
-    slide: openslide.OpenSlide,
-    tile_box: Tuple[int, int, int, int],
+    staged: Tuple[torch.Tensor, Any],
+    tile_shapes: List[Tuple[int, int]],
     pixel_size_um: float,
+) -> List[np.ndarray]:
+    """
+    Run one InstanSeg forward pass over a batch staged by `_TileStager`.
+
+    `eval_small_image` only accepts a single image, so this mirrors its
+    preprocessing (rescale to model pixel size, per-image percentile
+    normalisation) on the stacked (B, 3, H, W) tensor. Padding from edge
+    tiles is cropped back off using `tile_shapes`.
+
+    Returns the raw int32 output per tile; see `_to_label_image`.
+    """
+    device = torch.device(model.inference_device)
+    net = model.instanseg
+
+    batch, uploaded = staged
+    if uploaded is not None:
+        # Compute must not start before the side-stream copy has landed
+        compute = torch.cuda.current_stream(device)
+        compute.wait_event(uploaded)
+        batch.record_stream(compute)
+    bh, bw = batch.shape[1:3]
+    batch = batch.permute(0, 3, 1, 2).float()
+
+    scale = pixel_size_um / net.pixel_size
+    rescaled = not np.isclose(scale, 1.0, rtol=0.01)
+    if rescaled:
+        batch = F.interpolate(batch, scale_factor=scale, mode="bilinear")
+
+    batch = torch.stack([percentile_normalize(img) for img in batch])
+
+    # Input stays FP32: autocast casts each op's inputs itself, and a
+    # pre-cast batch would hit FP32-only ops in the TorchScript net
+    half = _half_dtype(device)
+    autocast = torch.amp.autocast("cuda", dtype=half or torch.float16, enabled=half is not None)
+    with torch.no_grad(), autocast:
+        instances = net(batch, target_segmentation=torch.tensor([1, 1]))
+
+    if rescaled:
+        instances = F.interpolate(instances, size=(bh, bw), mode="nearest")
+
+    # Labels come back as floats; cast on the device so the host gets ints
+    instances = instances.to(torch.int32).cpu().numpy()
+    return [instances[i, ..., :h, :w] for i, (h, w) in enumerate(tile_shapes)]
+
+
+# Cells are kept column-wise (one int32 array per field) rather than as one
+# dict per cell; records are only built when a tile is written to cells.jsonl.
+CELL_FIELDS = ("x_min", "y_min", "x_max", "y_max", "area", "tile_index")
+BBOX_FIELDS = CELL_FIELDS[:4]
+Cells = Dict[str, np.ndarray]
+
+
+def _concat_cells(parts: List[Cells], fields: Tuple[str, ...] = CELL_FIELDS) -> Cells:
+    if not parts:
+        return {f: np.empty(0, dtype=np.int32) for f in fields}
+    return {f: np.concatenate([p[f] for p in parts]) for f in fields}
+
+
+def _cells_from_mask(
+    mask: np.ndarray,
+    tile_box: Tuple[int, int, int, int],
     tile_index: int,
-) -> List[Dict[str, Any]]:
-    
-    x, y, w, h = tile_box
-
-    def _work():
-        region = slide.read_region((x, y), 0, (w, h)).convert("RGB")
-        tile_np = np.asarray(region, dtype=np.uint8)
-
-        # Run InstanSeg
-        labeled_output, _ = model.eval_small_image(tile_np, pixel_size_um)
-
-        # tensor → numpy
-        mask = labeled_output.detach().cpu().numpy() if hasattr(labeled_output, "detach") \
-            else np.asarray(labeled_output)
-
-        # Squeeze shape
-        while mask.ndim > 2 and mask.shape[0] == 1:
-            mask = np.squeeze(mask, axis=0)
-
-        if mask.ndim == 3:
-            mask = np.argmax(mask, axis=-1)
-
-        mask = mask.astype("int32")
-
-        cells = []
-        for prop in regionprops(mask):
-            minr, minc, maxr, maxc = prop.bbox
+) -> Cells:
+    x, y, _, _ = tile_box
+
+    # One C-level pass each for bboxes and areas of every label
+    slices = ndimage.find_objects(mask)
+    areas = np.bincount(mask.ravel())
+
+    # (label, row_start, col_start, row_stop, col_stop) per present label
+    found = np.array(
+        [(label, sl[0].start, sl[1].start, sl[0].stop, sl[1].stop)
+         for label, sl in enumerate(slices, start=1) if sl is not None],
+        dtype=np.int32,
+    ).reshape(-1, 5)
+    labels, r0, c0, r1, c1 = found.T
+
+    # real coordinates
+    return {
+        "x_min": c0 + np.int32(x),
+        "y_min": r0 + np.int32(y),
+        "x_max": c1 + np.int32(x),
+        "y_max": r1 + np.int32(y),
+        "area": areas[labels].astype(np.int32),
+        "tile_index": np.full(len(labels), tile_index, dtype=np.int32),
+    }
+
+
+def _cell_lines(cells: Cells, tile_box: Tuple[int, int, int, int]) -> str:
+    """Serialize one tile's cells as cells.jsonl lines (one record per cell)."""
+    origin = list(tile_box[:2])
+    return "".join(
+        json.dumps({
+            "bbox": {"x_min": x1, "y_min": y1, "x_max": x2, "y_max": y2},
+            "area_pixels": float(area),
+            "tile_index": idx,
+            "tile_origin": origin,
+        }) + "\n"
+        for x1, y1, x2, y2, area, idx in zip(*(cells[f].tolist() for f in CELL_FIELDS))
+    )
+
+
+def _tile_cells(
+    output: np.ndarray,
+    tile_box: Tuple[int, int, int, int],
+    tile_index: int,
+) -> Tuple[Cells, str]:
+    # Label conversion and cell extraction stay on one thread so the
+    # scratch buffer from _to_label_image is consumed before it's reused.
+    cells = _cells_from_mask(_to_label_image(output), tile_box, tile_index)
+    return cells, _cell_lines(cells, tile_box)
 
-            # real coordinates
-            cells.append({
-                "bbox": {
-                    "x_min": int(x + minc),
-                    "y_min": int(y + minr),
-                    "x_max": int(x + maxc),
-                    "y_max": int(y + maxr),
-                },
-                "area_pixels": float(prop.area),
-                "tile_index": tile_index,
-                "tile_origin": (x, y),
-            })
 
-        return cells
+async def _segment_tiles(
+    job: JobInternal,
+    replicas: List[_Replica],
+    slide: openslide.OpenSlide,
+    tiles: List[Tuple[int, Tuple[int, int, int, int]]],
+    pixel_size_um: float,
+    cells_file,
+    depth: int = PIPELINE_DEPTH,
+    batch_size: int = BATCH_SIZE,
+    io_workers: int = IO_WORKERS,
+) -> Cells:
+    """
+    Three-stage tile pipeline over (tile_index, tile_box) pairs, processed in
+    the given order: while one batch is on the GPU, the next tiles
+    are being decoded by OpenSlide and the previous ones post-processed.
+    Bounded queues keep at most `depth` tiles (or one batch, if larger)
+    buffered between stages.
+
+    Decoding runs on a pool of `io_workers` threads that always has `depth`
+    reads in flight; tiles are still handed on in order.
+
+    The inference stage runs WORKERS_PER_REPLICA workers per model replica,
+    all pulling from the same decode queue, so tiles spread across every
+    available GPU and each GPU's uploads overlap its compute.
+
+    Each tile's cell records are appended to `cells_file` as they are
+    produced; only the bbox columns are returned, for rendering the mask.
+    """
+    n_workers = len(replicas) * WORKERS_PER_REPLICA
+    depth = max(depth, batch_size)
+    decoded_q: asyncio.Queue = asyncio.Queue(maxsize=depth)
+    result_q: asyncio.Queue = asyncio.Queue(maxsize=depth)
+    parts: List[Cells] = []
+
+    loop = asyncio.get_running_loop()
+    io_pool = ThreadPoolExecutor(max_workers=max(io_workers, 1))
+
+    async def _decode():
+        pending = iter(tiles)
+        in_flight: deque = deque()
+
+        def _submit():
+            item = next(pending, None)
+            if item is not None:
+                idx, tbox = item
+                read = loop.run_in_executor(io_pool, _read_tile, slide, tbox)
+                in_flight.append((idx, tbox, read))
+
+        for _ in range(depth):
+            _submit()
+        while in_flight:
+            idx, tbox, read = in_flight.popleft()
+            tile_np = await read
+            _submit()
+            await decoded_q.put((idx, tbox, tile_np))
+        for _ in range(n_workers):
+            await decoded_q.put(_PIPELINE_DONE)
+
+    async def _infer(replica: _Replica):
+        exhausted = False
+        while not exhausted:
+            batch = []
+            while len(batch) < batch_size:
+                item = await decoded_q.get()
+                if item is _PIPELINE_DONE:
+                    exhausted = True
+                    break
+                batch.append(item)
+            if not batch:
+                break
+
+            tiles_np = [t for _, _, t in batch]
+            staged = await asyncio.to_thread(replica.stager.upload, tiles_np)
+            async with replica.gpu:
+                outputs = await asyncio.to_thread(
+                    _segment_tile_batch, replica.model, staged,
+                    [t.shape[:2] for t in tiles_np], pixel_size_um,
+                )
+            for (idx, tbox, _), output in zip(batch, outputs):
+                await result_q.put((idx, tbox, output))
+        await result_q.put(_PIPELINE_DONE)
+
+    async def _postprocess():
+        running = n_workers
+        while running:
+            item = await result_q.get()
+            if item is _PIPELINE_DONE:
+                running -= 1
+                continue
+            idx, tbox, output = item
+            cells, lines = await asyncio.to_thread(_tile_cells, output, tbox, idx)
+            await cells_file.write(lines)
+            parts.append({f: cells[f] for f in BBOX_FIELDS})
+
+            job.tiles_done += 1
+            update_job_progress(job)
+
+    stages = [
+        asyncio.ensure_future(_decode()),
+        *(
+            asyncio.ensure_future(_infer(replica))
+            for replica in replicas
+            for _ in range(WORKERS_PER_REPLICA)
+        ),
+        asyncio.ensure_future(_postprocess()),
+    ]
+    try:
+        await asyncio.gather(*stages)
+    finally:
+        # A failing stage would leave the others blocked on their queues
+        for stage in stages:
+            stage.cancel()
+        # Drop queued reads, but wait for ones already inside OpenSlide:
+        # the caller closes the slide as soon as we return. Done blocking
+        # (at most `depth` tile reads) so a second cancel can't cut it short.
+        io_pool.shutdown(wait=True, cancel_futures=True)
 
-    return await asyncio.to_thread(_work)
+    return _concat_cells(parts, BBOX_FIELDS)
 
 
 # ============================================================
@@ -162,23 +553,23 @@ async def _segment_tile(
 
 #     combined = Image.alpha_composite(base, red_layer).convert("RGB")
 #     combined.save(out_overlay_path)
-def render_cell_overlay(slide, all_cells, out_mask_path, out_overlay_path):
-    lowres, lw, lh, sx, sy = load_lowres_wsi(slide)
+def render_cell_overlay(
+    wsi_path, cells: Cells, out_mask_path, out_overlay_path, use_thumbnail: bool = False
+):
+    lowres, lw, lh, sx, sy = load_lowres_wsi(wsi_path, use_thumbnail)
 
     # -------- LOW-RES MASK --------
-    mask = Image.new("L", (lw, lh), 0)
-    draw = ImageDraw.Draw(mask)
-
-    for c in all_cells:
-        bx = c["bbox"]
-        x1 = int(bx["x_min"] * sx)
-        y1 = int(bx["y_min"] * sy)
-        x2 = int(bx["x_max"] * sx)
-        y2 = int(bx["y_max"] * sy)
+    x1 = (cells["x_min"] * sx).astype(np.int32)
+    y1 = (cells["y_min"] * sy).astype(np.int32)
+    x2 = (cells["x_max"] * sx).astype(np.int32)
+    y2 = (cells["y_max"] * sy).astype(np.int32)
 
-        draw.rectangle([(x1, y1), (x2, y2)], fill=255)
+    mask = rasterize_boxes(x1, y1, x2, y2, lw, lh)
+    Image.fromarray(mask).save(out_mask_path)
 
-    mask.save(out_mask_path)
+    # -------- LOW-RES OVERLAY (cells tinted red) --------
+    overlay = tint_red(np.asarray(lowres, dtype=np.uint8), mask, 0.35)
+    Image.fromarray(overlay).save(out_overlay_path)
 
 
 
@@ -186,8 +577,23 @@ def render_cell_overlay(slide, all_cells, out_mask_path, out_overlay_path):
 #   CELL SEGMENTATION JOB
 # ============================================================
 
+def _tissue_tile_ids(
+    wsi_path: str, tiles: np.ndarray, min_tissue: float, use_thumbnail: bool
+) -> np.ndarray:
+    """
+    Indices of the tiles whose tissue fraction in the low-res view is above
+    `min_tissue`. Load, Otsu and coverage all block, so call it via
+    asyncio.to_thread.
+    """
+    lowres, _, _, sx, sy = load_lowres_wsi(wsi_path, use_thumbnail)
+    tissue = compute_tissue_mask(np.asarray(lowres, dtype=np.uint8))
+    coverage = tile_coverage(tissue, tiles, sx, sy)
+    return np.flatnonzero(coverage > min_tissue)
+
+
 async def run_cell_segmentation(job: JobInternal) -> None:
-    await asyncio.sleep(15)
+    if os.environ.get("WSI_SLEEP_STUB"):  # simulate slow jobs for frontend work
+        await asyncio.sleep(15)
     wsi_path = job.params["wsi_path"]
     if not os.path.exists(wsi_path):
         raise FileNotFoundError(wsi_path)
@@ -197,49 +603,75 @@ async def run_cell_segmentation(job: JobInternal) -> None:
     pixel_size_um = float(job.params.get("pixel_size_um", 0.5))  # tutorial default
     max_tiles = job.params.get("max_tiles")
     max_tiles = int(max_tiles) if max_tiles else None
+    # Tiles with less tissue than this are skipped; <= 0 segments every tile
+    min_tissue = float(job.params.get("min_tissue_fraction", MIN_TISSUE_FRACTION))
+    # Use the slide's stored thumbnail instead of the coarsest level
+    use_thumbnail = bool(job.params.get("lowres_thumbnail", False))
 
-    # Open WSI
+    # Open WSI once for every tile read
     slide = openslide.OpenSlide(wsi_path)
-    width, height = slide.dimensions
-
-    # Build tiles
-    tiles = compute_tile_grid(width, height, tile_size, overlap)
-    if max_tiles:
-        tiles = tiles[:max_tiles]
-
-    job.tiles_total = len(tiles)
-
-    # Load shared InstanSeg model
-    model = await get_instanseg_model()
-    all_cells = []
-
-    # Process tiles
-    for idx, tbox in enumerate(tiles):
-        cells = await _segment_tile(model, slide, tbox, pixel_size_um, idx)
-        all_cells.extend(cells)
-
-        job.tiles_done = idx + 1
-        update_job_progress(job)
-
-    slide.close()
-
-    # ----------------------------------------------------
-    # Correct paths (filesystem vs. public URLs)
-    # ----------------------------------------------------
-    out_dir = get_job_output_dir(job.id)  # outputs/<job_id>  (FS PATH)
-    mask_fs = out_dir / "mask.png"        # FS path
-    overlay_fs = out_dir / "overlay.png"  # FS path
-
-    # Public URLs the browser can access
-    mask_url = f"/outputs/{job.id}/mask.png"
-    overlay_url = f"/outputs/{job.id}/overlay.png"
-
-    # ----------------------------------------------------
-    # Render overlays
-    # ----------------------------------------------------
-    slide2 = openslide.OpenSlide(wsi_path)
-    render_cell_overlay(slide2, all_cells, str(mask_fs), str(overlay_fs))
-    slide2.close()
+    try:
+        width, height = slide.dimensions
+
+        # Build tiles
+        tiles = compute_tile_grid(width, height, tile_size, overlap)
+        tile_ids = np.arange(len(tiles))
+
+        # Skip background tiles: no cells there, and InstanSeg is the
+        # expensive part
+        if min_tissue > 0:
+            tile_ids = await asyncio.to_thread(
+                _tissue_tile_ids, wsi_path, tiles, min_tissue, use_thumbnail
+            )
+        tiles_skipped = len(tiles) - len(tile_ids)
+
+        if max_tiles:
+            tile_ids = tile_ids[:max_tiles]
+
+        job.tiles_total = len(tile_ids)
+
+        # Visit tiles in Z-order for OpenSlide cache reuse; keep grid indices
+        ordered_ids = tile_ids[morton_order(tiles[tile_ids], max(tile_size - overlap, 1))]
+        ordered_tiles = [
+            (idx, tuple(tbox))
+            for idx, tbox in zip(ordered_ids.tolist(), tiles[ordered_ids].tolist())
+        ]
+
+        # Load shared InstanSeg replicas (one per GPU)
+        replicas = await get_instanseg_replicas()
+
+        # ----------------------------------------------------
+        # Correct paths (filesystem vs. public URLs)
+        # ----------------------------------------------------
+        out_dir = job_output_dir(job)         # outputs/<job_id>  (FS PATH)
+        mask_fs = out_dir / "mask.png"        # FS path
+        overlay_fs = out_dir / "overlay.png"  # FS path
+        cells_fs = out_dir / "cells.jsonl"    # FS path
+
+        # Public URLs the browser can access
+        mask_url = f"/outputs/{job.id}/mask.png"
+        overlay_url = f"/outputs/{job.id}/overlay.png"
+        cells_url = f"/outputs/{job.id}/cells.jsonl"
+
+        # Process tiles (decode / inference / post-processing overlap),
+        # streaming cell records to disk as each tile finishes
+        prefetch = int(job.params.get("prefetch_tiles", PIPELINE_DEPTH))
+        batch_size = int(job.params.get("batch_size", BATCH_SIZE))
+        io_workers = int(job.params.get("io_workers", IO_WORKERS))
+        async with aiofiles.open(cells_fs, "w") as cells_file:
+            cells = await _segment_tiles(
+                job, replicas, slide, ordered_tiles, pixel_size_um, cells_file,
+                prefetch, batch_size, io_workers,
+            )
+
+        # ----------------------------------------------------
+        # Render overlays
+        # ----------------------------------------------------
+        await asyncio.to_thread(
+            render_cell_overlay, wsi_path, cells, str(mask_fs), str(overlay_fs), use_thumbnail
+        )
+    finally:
+        slide.close()
 
     # ----------------------------------------------------
     # Save result JSON with URL paths (public paths only)
@@ -251,8 +683,9 @@ async def run_cell_segmentation(job: JobInternal) -> None:
     "wsi_path": wsi_path,
     "pixel_size_um": pixel_size_um,
     "tiles_processed": job.tiles_total,
-    "num_cells": len(all_cells),
-    "cells": all_cells,
+    "tiles_skipped": tiles_skipped,
+    "num_cells": len(cells["x_min"]),
+    "cells_url": cells_url,
     })
 
 
@@ -263,35 +696,25 @@ async def run_cell_segmentation(job: JobInternal) -> None:
 # ============================================================
 
 async def run_tissue_mask(job: JobInternal) -> None:
-    await asyncio.sleep(15)
+    if os.environ.get("WSI_SLEEP_STUB"):  # simulate slow jobs for frontend work
+        await asyncio.sleep(15)
     wsi_path = job.params["wsi_path"]
     if not os.path.exists(wsi_path):
         raise FileNotFoundError(wsi_path)
 
-    # Open whole-slide image
-    slide = openslide.OpenSlide(wsi_path)
-
     # ---------------------------------------------------------
     # Low-resolution WSI for tissue mask (fast + high quality)
     # ---------------------------------------------------------
-    lowres, lw, lh, sx, sy = load_lowres_wsi(slide)
+    use_thumbnail = bool(job.params.get("lowres_thumbnail", False))
+    lowres, lw, lh, sx, sy = await asyncio.to_thread(load_lowres_wsi, wsi_path, use_thumbnail)
 
     low_np = np.asarray(lowres, dtype=np.uint8)
-    gray = rgb2gray(low_np)
-
-    # Global Otsu threshold
-    try:
-        th = threshold_otsu(gray)
-        tissue = gray < th
-    except Exception:
-        tissue = gray < 0.85     # fallback threshold
-
-    binary = (tissue * 255).astype(np.uint8)
+    tissue = compute_tissue_mask(low_np)
 
     # ---------------------------------------------------------
     # Output paths
     # ---------------------------------------------------------
-    out_dir = get_job_output_dir(job.id)
+    out_dir = job_output_dir(job)
     
     # filesystem paths (real paths)
     mask_fs = out_dir / "tissue_mask.png"
@@ -302,21 +725,16 @@ async def run_tissue_mask(job: JobInternal) -> None:
     overlay_url = f"/outputs/{job.id}/tissue_overlay.png"
 
     # ---------------------------------------------------------
-    # Save binary mask
+    # Save binary mask (1-bit PNG, packed 8 pixels per byte)
     # ---------------------------------------------------------
-    Image.fromarray(binary).save(str(mask_fs))
+    packed = np.packbits(tissue, axis=1)
+    Image.frombytes("1", (lw, lh), packed.tobytes()).save(str(mask_fs))
 
     # ---------------------------------------------------------
     # Save overlay (tissue tinted red)
     # ---------------------------------------------------------
-    overlay = lowres.copy()
-    red = Image.new("RGB", (lw, lh), (255, 0, 0))
-    alpha = Image.fromarray((tissue * 90).astype(np.uint8))  # opacity 90/255
-
-    overlay.paste(red, mask=alpha)
-    overlay.save(str(overlay_fs))
-
-    slide.close()
+    overlay = tint_red(low_np, tissue.view(np.uint8) * np.uint8(255), 90 / 255)  # opacity 90/255
+    Image.fromarray(overlay).save(str(overlay_fs))
 
     # ---------------------------------------------------------
     # Save result JSON
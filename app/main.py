@@ -2,6 +2,7 @@
 from __future__ import annotations
 
 import asyncio
+import anyio.to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -9,8 +10,12 @@ from fastapi.responses import FileResponse
 import os
 from app.routers import workflow_routes, job_routes, user_routes
 from app.scheduler_core import scheduler_loop
+from app.utils.storage import progress_writer_loop
 
 
+# Worker threads for sync routes and run_in_threadpool (anyio's default is 40)
+THREADPOOL_TOKENS = 200
+
 app = FastAPI(
     title="WSI Workflow Scheduler",
     version="0.1.0",
@@ -60,4 +65,6 @@ app.add_middleware(
 # ------------------------------------------------------------
 @app.on_event("startup")
 async def startup_event():
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_TOKENS
+    asyncio.create_task(progress_writer_loop())
     asyncio.create_task(scheduler_loop())
@@ -1,8 +1,11 @@
 # app/models.py
 from __future__ import annotations
 
+import time
+from dataclasses import dataclass, field
 from enum import Enum
 from datetime import datetime
+from pathlib import Path
 from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel, Field
@@ -70,41 +73,48 @@ class WorkflowRead(BaseModel):
 
 # ---------- Internal Models (used by scheduler) ----------
 
+# Slotted dataclasses: no per-instance __dict__, and identity equality as
+# before. Only the identifying fields are constructor arguments; the rest
+# is runtime state with fixed initial values.
+
+@dataclass(slots=True, eq=False)
 class JobInternal:
-    def __init__(
-        self,
-        id: str,
-        workflow_id: str,
-        branch_id: str,
-        user_id: str,
-        job_type: JobType,
-        params: Dict[str, Any],
-    ) -> None:
-        self.id = id
-        self.workflow_id = workflow_id
-        self.branch_id = branch_id
-        self.user_id = user_id
-        self.job_type = job_type
-        self.params = params
-
-        self.status: JobStatus = JobStatus.PENDING
-        self.progress: float = 0.0
-        self.tiles_done: int = 0
-        self.tiles_total: int = 0
-        self.error: Optional[str] = None
-
-        self.created_at: datetime = datetime.utcnow()
-        self.started_at: Optional[datetime] = None
-        self.finished_at: Optional[datetime] = None
+    id: str
+    workflow_id: str
+    branch_id: str
+    user_id: str
+    job_type: JobType
+    params: Dict[str, Any]
+
+    status: JobStatus = field(default=JobStatus.PENDING, init=False)
+    progress: float = field(default=0.0, init=False)
+    tiles_done: int = field(default=0, init=False)
+    tiles_total: int = field(default=0, init=False)
+    error: Optional[str] = field(default=None, init=False)
 
+    # Epoch nanoseconds (time.time_ns()); converted to UTC datetimes
+    # only when a job is read out (see workflow_manager.ns_to_datetime)
+    created_ns: int = field(default_factory=time.time_ns, init=False)
+    started_ns: Optional[int] = field(default=None, init=False)
+    finished_ns: Optional[int] = field(default=None, init=False)
 
+    # Last progress.json payload written, and the job's output directory
+    # once created (see storage)
+    _last_progress_bytes: Optional[bytes] = field(default=None, init=False, repr=False)
+    _out_dir: Optional[Path] = field(default=None, init=False, repr=False)
+
+
+@dataclass(slots=True, eq=False)
 class WorkflowInternal:
-    def __init__(self, id: str, name: str, user_id: str) -> None:
-        self.id = id
-        self.name = name
-        self.user_id = user_id
-        self.created_at: datetime = datetime.utcnow()
-        self.job_ids: List[str] = []
+    id: str
+    name: str
+    user_id: str
+    created_ns: int = field(default_factory=time.time_ns, init=False)
+    job_ids: List[str] = field(default_factory=list, init=False)
+
+    # Running sum of job progress, kept up to date by set_job_progress
+    _progress_sum: float = field(default=0.0, init=False, repr=False)
+    _progress_n: int = field(default=0, init=False, repr=False)
 
 
 class ActiveUsersRead(BaseModel):
@@ -3,12 +3,21 @@ from __future__ import annotations
 
 import os
 import json
-from fastapi import APIRouter, Depends, Header, HTTPException, status
-from fastapi.responses import FileResponse
-
-from app.models import JobRead, JobResult, JobStatus
+from collections import OrderedDict
+from email.utils import formatdate, parsedate
+from pathlib import Path
+from typing import Any, Dict, Tuple, Union
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import FileResponse, Response
+from starlette.concurrency import run_in_threadpool
+
+from app.deps import get_user_id
+from app.models import JobInternal, JobRead, JobResult, JobStatus
+from app.utils.responses import ORJSONResponse
 from app.workflow_manager import (
     get_job_for_user,
+    job_to_dict,
     job_to_read,
     list_jobs_for_workflow,
     cancel_pending_job,
@@ -16,10 +25,14 @@ from app.workflow_manager import (
 
 router = APIRouter(prefix="/jobs", tags=["jobs"])
 
+# job_id -> (result.json mtime_ns, parsed result), most recently used last
+_RESULT_CACHE: "OrderedDict[str, Tuple[int, Dict[str, Any]]]" = OrderedDict()
+_RESULT_CACHE_SIZE = 256
 
-# Extract user ID
-async def get_user_id(x_user_id: str = Header(..., alias="X-User-ID")) -> str:
-    return x_user_id
+# When served behind nginx, e.g. "/internal-outputs/": image routes answer
+# with an X-Accel-Redirect to <prefix><job_id>/<file> and nginx sends the
+# file itself (sendfile) from an `internal` location
+_ACCEL_REDIRECT_PREFIX = os.environ.get("WSI_ACCEL_REDIRECT_PREFIX")
 
 
 # ---------------------------------------------------------
@@ -37,13 +50,19 @@ async def get_job_route(job_id: str, user_id: str = Depends(get_user_id)):
 # ---------------------------------------------------------
 # GET /jobs/workflow/{workflow_id}
 # ---------------------------------------------------------
-@router.get("/workflow/{workflow_id}", response_model=list[JobRead])
+# (plain dicts through orjson: no per-job JobRead build or revalidation;
+# the schema is still documented via `responses`)
+@router.get(
+    "/workflow/{workflow_id}",
+    response_model=None,
+    responses={200: {"model": list[JobRead]}},
+)
 async def list_jobs_for_workflow_route(workflow_id: str, user_id: str = Depends(get_user_id)):
     try:
         jobs = list_jobs_for_workflow(user_id, workflow_id)
     except KeyError:
         raise HTTPException(status_code=404, detail="Workflow not found")
-    return [job_to_read(j) for j in jobs]
+    return ORJSONResponse([job_to_dict(j) for j in jobs])
 
 
 # ---------------------------------------------------------
@@ -78,31 +97,107 @@ async def get_job_result(job_id: str, user_id: str = Depends(get_user_id)):
     
     result_path = os.path.join("outputs", job_id, "result.json")
 
-    if not os.path.exists(result_path):
+    # Reuse the parsed result while the file is unchanged; otherwise load
+    # raw JSON off the event loop. The cache is only touched here, on the
+    # loop, so it needs no lock.
+    try:
+        st = await run_in_threadpool(os.stat, result_path)
+        entry = _RESULT_CACHE.get(job_id)
+        if entry is not None and entry[0] == st.st_mtime_ns:
+            _RESULT_CACHE.move_to_end(job_id)
+            data = entry[1]
+        else:
+            data = await run_in_threadpool(_load_json, result_path)
+            _cache_result(job_id, st.st_mtime_ns, data)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Result file not found")
 
-    # Load raw JSON
-    with open(result_path, "r") as f:
-        data = json.load(f)
-
     # Return directly so frontend sees mask_png & overlay_png at TOP
-    return {"job_id": job_id, "data": data}
+    return ORJSONResponse({"job_id": job_id, "data": data})
 
 
 # ---------------------------------------------------------
 # Direct image access 
+# (plain def: Starlette runs these in its threadpool, so the stat is
+# off the event loop)
 # ---------------------------------------------------------
 @router.get("/{job_id}/result/mask")
-async def get_mask(job_id: str, user_id: str = Depends(get_user_id)):
-    path = os.path.join("outputs", job_id, "mask.png")
-    if not os.path.exists(path):
-        raise HTTPException(status_code=404, detail="mask.png not found")
-    return FileResponse(path)
+def get_mask(job_id: str, request: Request, user_id: str = Depends(get_user_id)):
+    job = _job_or_404(user_id, job_id)
+    path = os.path.join("outputs", job.id, "mask.png")
+    return _png_response(request, path, "mask.png not found")
 
 
 @router.get("/{job_id}/result/overlay")
-async def get_overlay(job_id: str, user_id: str = Depends(get_user_id)):
-    path = os.path.join("outputs", job_id, "overlay.png")
-    if not os.path.exists(path):
-        raise HTTPException(status_code=404, detail="overlay.png not found")
-    return FileResponse(path)
+def get_overlay(job_id: str, request: Request, user_id: str = Depends(get_user_id)):
+    job = _job_or_404(user_id, job_id)
+    path = os.path.join("outputs", job.id, "overlay.png")
+    return _png_response(request, path, "overlay.png not found")
+
+
+# ---------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------
+def _job_or_404(user_id: str, job_id: str) -> JobInternal:
+    # Images are only served for the caller's own jobs, and their paths are
+    # built from the stored job id, never from the raw URL segment
+    try:
+        return get_job_for_user(user_id, job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+
+def _load_json(path: str) -> Dict[str, Any]:
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _not_modified(request: Request, etag: str, last_modified: str) -> bool:
+    # If-None-Match wins over If-Modified-Since when both are sent
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        if if_none_match.strip() == "*":
+            return True
+        return etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        since, modified = parsedate(if_modified_since), parsedate(last_modified)
+        return since is not None and modified is not None and since >= modified
+    return False
+
+
+def _cache_result(job_id: str, mtime_ns: int, data: Dict[str, Any]) -> None:
+    _RESULT_CACHE[job_id] = (mtime_ns, data)
+    _RESULT_CACHE.move_to_end(job_id)
+    while len(_RESULT_CACHE) > _RESULT_CACHE_SIZE:
+        _RESULT_CACHE.popitem(last=False)
+
+
+def _png_response(
+    request: Request, path: str, missing_detail: str
+) -> Union[FileResponse, Response]:
+    """
+    Serve a job's PNG with caching validators: polls for an unchanged file
+    get an empty 304, and FileResponse answers Range requests with 206.
+    FileResponse sends Content-Length from the stat, never chunked encoding,
+    and uses the server's zero-copy pathsend extension where available.
+    """
+    # One stat both checks existence and gives FileResponse the size and
+    # mtime, so it doesn't stat again before streaming
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=missing_detail)
+
+    headers = {
+        "etag": f'"{st.st_mtime_ns:x}-{st.st_size:x}"',
+        "last-modified": formatdate(st.st_mtime, usegmt=True),
+    }
+    if _not_modified(request, headers["etag"], headers["last-modified"]):
+        return Response(status_code=304, headers=headers)
+    if _ACCEL_REDIRECT_PREFIX:
+        rel = Path(path).relative_to("outputs").as_posix()
+        headers["x-accel-redirect"] = _ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + rel
+        return Response(media_type="image/png", headers=headers)
+    return FileResponse(path, media_type="image/png", headers=headers, stat_result=st)
@@ -1,11 +1,14 @@
 # app/routers/workflow_routes.py
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status
 
+from app.deps import get_user_id
 from app.models import WorkflowCreate, WorkflowRead
+from app.utils.responses import ORJSONResponse
 from app.workflow_manager import (
     create_workflow,
+    workflow_to_dict,
     workflow_to_read,
     list_workflows_for_user,
     get_workflow_for_user,
@@ -14,10 +17,6 @@ from app.workflow_manager import (
 router = APIRouter(prefix="/workflows", tags=["workflows"])
 
 
-async def get_user_id(x_user_id: str = Header(..., alias="X-User-ID")) -> str:
-    return x_user_id
-
-
 @router.post("/", response_model=WorkflowRead, status_code=status.HTTP_201_CREATED)
 async def create_workflow_route(
     payload: WorkflowCreate,
@@ -27,12 +26,12 @@ async def create_workflow_route(
     return workflow_to_read(wf)
 
 
-@router.get("/", response_model=list[WorkflowRead])
+@router.get("/", response_model=None, responses={200: {"model": list[WorkflowRead]}})
 async def list_workflows_route(
     user_id: str = Depends(get_user_id),
 ):
     wfs = list_workflows_for_user(user_id)
-    return [workflow_to_read(wf) for wf in wfs]
+    return ORJSONResponse([workflow_to_dict(wf) for wf in wfs])
 
 
 @router.get("/{workflow_id}", response_model=WorkflowRead)
@@ -2,81 +2,98 @@
 from __future__ import annotations
 
 import asyncio
-from datetime import datetime
-from typing import List
+import logging
+import time
+from contextlib import closing
+from typing import Iterator
 
-from app.utils.storage import save_job_progress
+from app.utils.storage import job_output_dir, save_job_progress
 from app.instanseg_tasks import run_job_body
 from app.models import JobStatus
 from app.workflow_manager import (
     JOBS,
     BRANCH_JOBS,
+    BRANCH_CURSOR,
     running_jobs,
     active_users,
-    scheduler_lock,
+    user_running_counts,
+    new_scheduler_wakeup,
+    set_job_progress,
+    wake_scheduler,
 )
 
 
+logger = logging.getLogger(__name__)
+
 # Tuning params
 MAX_WORKERS = 4          # Max concurrent RUNNING jobs globally
 MAX_ACTIVE_USERS = 3     # Max distinct users with RUNNING jobs at once
-SCHEDULER_INTERVAL = 0.5  # seconds
+SCHEDULER_INTERVAL = 30.0  # seconds; fallback pass when no wakeup arrives
+
+_FINISHED = (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED)
 
 
 async def execute_job(job_id: str) -> None:
     job = JOBS[job_id]
-    job.started_at = datetime.utcnow()
+    job.started_ns = time.time_ns()
+    job_output_dir(job)  # create outputs/<job_id> once, before any saves
 
     try:
         await run_job_body(job)
         job.status = JobStatus.SUCCEEDED
-        job.progress = 1.0
+        set_job_progress(job, 1.0)
 
     except Exception as exc:
         job.status = JobStatus.FAILED
         job.error = str(exc)
+        set_job_progress(job, job.progress)  # resync the workflow's sum
 
     finally:
-        job.finished_at = datetime.utcnow()
-        print("DEBUG FINAL WRITE:", job.status)
+        job.finished_ns = time.time_ns()
+        logger.debug("job %s finished with status %s", job.id, job.status)
         save_job_progress(job)
 
-        async with scheduler_lock:
-            running_jobs.discard(job.id)
-            still_running_for_user = any(
-                j.user_id == job.user_id and j.status == JobStatus.RUNNING
-                for j in JOBS.values()
-            )
-            if not still_running_for_user:
-                active_users.discard(job.user_id)
+        # No awaits between these updates, so a scheduling pass never sees
+        # them half done
+        running_jobs.discard(job.id)
+        user_running_counts[job.user_id] -= 1
+        if user_running_counts[job.user_id] <= 0:
+            del user_running_counts[job.user_id]
+            active_users.discard(job.user_id)
+        wake_scheduler()
 
 
-def _first_runnable_job_ids_per_branch() -> List[str]:
+def _runnable_job_ids() -> Iterator[str]:
     """
-    Return job_ids that are the first PENDING job in their branch and
+    Lazily yield job_ids that are the first PENDING job in their branch and
     whose predecessors in that branch are all finished (not PENDING/RUNNING).
-    """
-    runnable: List[str] = []
-
-    for (wf_id, branch_id), job_ids in BRANCH_JOBS.items():
-        for idx, jid in enumerate(job_ids):
-            job = JOBS[jid]
-            if job.status != JobStatus.PENDING:
-                continue
 
-            # Check all previous jobs in this branch
-            blocking = False
-            for prev_id in job_ids[:idx]:
-                prev = JOBS[prev_id]
-                if prev.status in (JobStatus.PENDING, JobStatus.RUNNING):
-                    blocking = True
-                    break
+    Each branch's cursor is moved past finished jobs as they're seen, and
+    a branch whose cursor reaches its end leaves BRANCH_CURSOR, so a pass
+    only looks at the heads of unfinished branches, and only at as many of
+    them as the caller consumes.
 
-            if not blocking:
-                runnable.append(jid)
-            break  # only first PENDING per branch considered
+    BRANCH_CURSOR is iterated in place: the consumer must not await while
+    the generator is open, so no workflow can be created mid-iteration.
+    Close it when done (finished branches are dropped on close).
+    """
+    done = []
+    try:
+        for key, idx in BRANCH_CURSOR.items():
+            job_ids = BRANCH_JOBS[key]
+            while idx < len(job_ids) and JOBS[job_ids[idx]].status in _FINISHED:
+                idx += 1
+            if idx == len(job_ids):
+                done.append(key)
+                continue
+            BRANCH_CURSOR[key] = idx
 
-    return runnable
+            if JOBS[job_ids[idx]].status == JobStatus.PENDING:
+                yield job_ids[idx]
+    finally:
+        # Deleting while the loop above runs would break its iteration
+        for key in done:
+            del BRANCH_CURSOR[key]
 
 
 async def schedule_once() -> None:
@@ -87,51 +104,68 @@ async def schedule_once() -> None:
       - MAX_WORKERS
       - MAX_ACTIVE_USERS
     """
-    print("schedule_once called")
-    print("running_jobs:", running_jobs)
-    print("active_users:", active_users)
-    print("BRANCH_JOBS:", BRANCH_JOBS)
-    print("All job statuses:", {jid: job.status for jid, job in JOBS.items()})
+    debug = logger.isEnabledFor(logging.DEBUG)
+    if debug:
+        logger.debug(
+            "schedule_once jobs=%d open_branches=%d running=%d active_users=%d",
+            len(JOBS), len(BRANCH_CURSOR), len(running_jobs), len(active_users),
+        )
 
     if len(running_jobs) >= MAX_WORKERS:
         return
 
-    candidates = _first_runnable_job_ids_per_branch()
-    print("Candidates:", candidates)
-    
-    for jid in candidates:
-        if len(running_jobs) >= MAX_WORKERS:
-            break
-
-        job = JOBS[jid]
-        user_id = job.user_id
+    # Candidates are produced lazily, so a saturated pass stops scanning
+    # branches as soon as MAX_WORKERS is reached
+    with closing(_runnable_job_ids()) as candidates:
+        for jid in candidates:
+            if len(running_jobs) >= MAX_WORKERS:
+                break
+            if debug:
+                logger.debug("schedule_once candidate=%s", jid)
 
-        # If user not already active, check user-limit
-        if user_id not in active_users and len(active_users) >= MAX_ACTIVE_USERS:
-            continue
+            job = JOBS[jid]
+            user_id = job.user_id
 
-        # Schedule job
-        if job.status != JobStatus.PENDING:
-            continue  # may have changed since we collected candidates
+            # If user not already active, check user-limit
+            if user_id not in active_users and len(active_users) >= MAX_ACTIVE_USERS:
+                continue
 
-        job.status = JobStatus.RUNNING
-        job.progress = 0.0
+            # Schedule job: PENDING -> RUNNING. No lock needed: every status
+            # change (cancel, execute_job, this pass) runs on the event loop,
+            # and there is no await between the check and the flip, so nothing
+            # can interleave with it.
+            if job.status != JobStatus.PENDING:
+                continue
+            job.status = JobStatus.RUNNING
+            set_job_progress(job, 0.0)
 
-        running_jobs.add(job.id)
-        active_users.add(user_id)
+            running_jobs.add(job.id)
+            active_users.add(user_id)
+            user_running_counts[user_id] += 1
 
-        asyncio.create_task(execute_job(job.id))
+            asyncio.create_task(execute_job(job.id))
 
 
 
  
 async def scheduler_loop() -> None:
     """
-    Background loop that periodically tries to schedule new jobs.
+    Background loop that runs a scheduling pass whenever scheduler_wakeup
+    is set, and at least every SCHEDULER_INTERVAL seconds as a safety net.
     """
-    print(">>> Scheduler loop started")
+    logger.info("Scheduler loop started")
+    wakeup = new_scheduler_wakeup()
+    wakeup.set()  # first pass right away, for jobs created before startup
     while True:
-        async with scheduler_lock:
+        try:
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=SCHEDULER_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            # Clear before the pass so wakeups that arrive during it are kept
+            wakeup.clear()
             await schedule_once()
-        await asyncio.sleep(SCHEDULER_INTERVAL)
+        except Exception:
+            # Keep the loop alive: if it died, every job would stay PENDING
+            logger.exception("Scheduling pass failed")
 
@@ -1,17 +1,19 @@
 # app/utils/progress.py
 from __future__ import annotations
 
-from app.utils.storage import save_job_progress
+from app.utils.storage import queue_job_progress
 from app.models import JobInternal
+from app.workflow_manager import set_job_progress
 
 
 def update_job_progress(job: JobInternal) -> None:
     """
     Update any derived job metrics and persist if needed.
-    Currently just ensures progress is in [0, 1] and calls a simple saver.
+    Currently just ensures progress is in [0, 1] and queues it for the
+    background progress writer.
     """
     if job.tiles_total > 0:
-        job.progress = job.tiles_done / job.tiles_total
+        set_job_progress(job, job.tiles_done / job.tiles_total)
     else:
-        job.progress = 0.0
-    save_job_progress(job)
+        set_job_progress(job, 0.0)
+    queue_job_progress(job)
@@ -0,0 +1,84 @@
+# app/utils/raster.py
+from __future__ import annotations
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # optional; rasterize_boxes falls back to pure NumPy
+    njit = None
+
+
+if njit is not None:
+    # Serial and nogil rather than parallel=True: callers already run this
+    # on worker threads (one per rendering job), and Numba's threading
+    # layers either hang the interpreter at exit (TBB) or abort on
+    # concurrent calls (workqueue) when launched from non-main threads
+    @njit(nogil=True, cache=True)
+    def _fill_boxes(x1, y1, x2, y2, out):
+        for i in range(len(x1)):
+            for yy in range(y1[i], y2[i]):
+                for xx in range(x1[i], x2[i]):
+                    out[yy, xx] = 255
+
+
+def rasterize_boxes(
+    x1: np.ndarray,
+    y1: np.ndarray,
+    x2: np.ndarray,
+    y2: np.ndarray,
+    width: int,
+    height: int,
+) -> np.ndarray:
+    """
+    Fill axis-aligned boxes into a (height, width) uint8 mask (255 inside).
+    Corners are inclusive, like ImageDraw.rectangle, and clipped to the image.
+
+    Two strategies, picked by whichever touches fewer pixels:
+      - total box area < image area and Numba is available: fill the boxes
+        directly with a JIT loop that releases the GIL, O(sum of box areas);
+      - otherwise a 2-D difference image: +1/-1 at the four corners of every
+        box, then two cumulative sums, O(width * height) however many boxes.
+    """
+    x1, y1, x2, y2 = (np.asarray(v, dtype=np.int64) for v in (x1, y1, x2, y2))
+
+    # Boxes entirely off-image would otherwise be clipped onto its border
+    inside = (x2 >= 0) & (y2 >= 0) & (x1 < width) & (y1 < height)
+    x1 = np.clip(x1[inside], 0, width - 1)
+    y1 = np.clip(y1[inside], 0, height - 1)
+    x2 = np.clip(x2[inside], 0, width - 1) + 1
+    y2 = np.clip(y2[inside], 0, height - 1) + 1
+
+    if njit is not None and np.sum((x2 - x1) * (y2 - y1)) < width * height:
+        mask = np.zeros((height, width), dtype=np.uint8)
+        _fill_boxes(x1, y1, x2, y2, mask)
+        return mask
+
+    stride = width + 1
+    size = (height + 1) * stride
+    plus = np.bincount(np.concatenate([y1 * stride + x1, y2 * stride + x2]), minlength=size)
+    minus = np.bincount(np.concatenate([y1 * stride + x2, y2 * stride + x1]), minlength=size)
+
+    coverage = (plus - minus).reshape(height + 1, stride)
+    np.cumsum(coverage, axis=0, out=coverage)
+    np.cumsum(coverage, axis=1, out=coverage)
+
+    mask = np.zeros((height, width), dtype=np.uint8)
+    mask[coverage[:height, :width] > 0] = 255
+    return mask
+
+
+def tint_red(base: np.ndarray, mask: np.ndarray, opacity: float) -> np.ndarray:
+    """
+    Blend pure red over an (H, W, 3) uint8 image where `mask` (H, W uint8,
+    0-255) is set, at the given opacity. Done in place on one float copy of
+    `base`, without materialising a full-size red layer.
+    """
+    alpha = mask.astype(np.float32)
+    alpha *= opacity / 255.0
+
+    out = base.astype(np.float32)
+    out *= (1.0 - alpha)[..., None]
+    out[..., 0] += 255.0 * alpha
+    out += 0.5  # round, not truncate, on the cast back
+    return out.astype(np.uint8)
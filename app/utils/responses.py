@@ -0,0 +1,18 @@
+# app/utils/responses.py
+from __future__ import annotations
+
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson, for routes that hand back plain dicts
+    (datetimes and enums included) instead of Pydantic models. UTC datetimes
+    end in "Z", as Pydantic writes them.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
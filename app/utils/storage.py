@@ -1,15 +1,34 @@
 # app/utils/storage.py
 from __future__ import annotations
 
+import asyncio
 import json
+import os
+import threading
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
 
-from app.models import JobInternal
+import orjson
+
+from app.models import JobInternal, JobStatus
 
 BASE_OUTPUT_DIR = Path("outputs")
 BASE_OUTPUT_DIR.mkdir(exist_ok=True)
 
+# Seconds the background writer waits for progress updates to coalesce
+PROGRESS_FLUSH_INTERVAL = 0.1
+_TERMINAL = (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+# Wakes the progress writer; job_ids only, the data lives in PENDING_SNAPSHOT.
+# Created by progress_writer_loop on its own event loop (a queue made at
+# import time binds to the first loop that waits on it)
+PROGRESS_Q: "Optional[asyncio.Queue[str]]" = None
+# job_id -> (job, latest progress snapshot) waiting to be written
+PENDING_SNAPSHOT: Dict[str, Tuple[JobInternal, Dict[str, Any]]] = {}
+_writer_running = False
+# Serializes progress.json writes between the writer thread and direct saves
+_progress_write_lock = threading.Lock()
+
 
 def get_job_output_dir(job_id: str) -> Path:
     d = BASE_OUTPUT_DIR / job_id
@@ -17,24 +36,104 @@ def get_job_output_dir(job_id: str) -> Path:
     return d
 
 
-def save_job_progress(job: JobInternal) -> None:
+def job_output_dir(job: JobInternal) -> Path:
     """
-    Save a tiny JSON sidecar with progress. Real version would go to DB/Redis.
+    outputs/<job_id> for a job, created on first use and then remembered on
+    the job, so repeated saves don't mkdir again. execute_job creates it
+    before the job body runs.
     """
-    data = {
+    if job._out_dir is None:
+        job._out_dir = get_job_output_dir(job.id)
+    return job._out_dir
+
+
+def _progress_snapshot(job: JobInternal) -> Dict[str, Any]:
+    return {
         "status": job.status,
         "progress": job.progress,
         "tiles_done": job.tiles_done,
         "tiles_total": job.tiles_total,
         "error": job.error,
     }
-    out_file = get_job_output_dir(job.id) / "progress.json"
-    out_file.write_text(json.dumps(data, indent=2))
+
+
+def _write_progress(job: JobInternal, data: Dict[str, Any]) -> None:
+    # Skip unchanged payloads; replace atomically so readers never see a
+    # partial write. Caller holds _progress_write_lock.
+    payload = orjson.dumps(data)
+    if payload == job._last_progress_bytes:
+        return
+
+    out_file = job_output_dir(job) / "progress.json"
+    tmp_file = out_file.with_suffix(".json.tmp")
+    tmp_file.write_bytes(payload)
+    os.replace(tmp_file, out_file)
+    job._last_progress_bytes = payload
+
+
+def _write_pending(pending: List[Tuple[JobInternal, Dict[str, Any]]]) -> None:
+    with _progress_write_lock:
+        for job, data in pending:
+            # A finished job's final state was written directly; don't
+            # overwrite it with an older running snapshot
+            if job.status in _TERMINAL and data["status"] not in _TERMINAL:
+                continue
+            _write_progress(job, data)
+
+
+def save_job_progress(job: JobInternal) -> None:
+    """
+    Save a tiny JSON sidecar with progress. Real version would go to DB/Redis.
+    Writes immediately; use queue_job_progress for frequent updates.
+    """
+    PENDING_SNAPSHOT.pop(job.id, None)
+    with _progress_write_lock:
+        _write_progress(job, _progress_snapshot(job))
+
+
+def queue_job_progress(job: JobInternal) -> None:
+    """
+    Hand a progress update to the background writer, which keeps only the
+    latest snapshot per job. Final statuses, and updates made while no
+    writer is running, are saved right away.
+    """
+    if job.status in _TERMINAL or not _writer_running:
+        save_job_progress(job)
+        return
+    if job.id not in PENDING_SNAPSHOT:
+        PROGRESS_Q.put_nowait(job.id)
+    PENDING_SNAPSHOT[job.id] = (job, _progress_snapshot(job))
+
+
+async def progress_writer_loop() -> None:
+    """
+    Background task writing queued progress: after each wakeup it waits
+    PROGRESS_FLUSH_INTERVAL for more updates, then writes every pending job
+    once, so a job's progress.json changes at most once per interval.
+    """
+    global PROGRESS_Q, _writer_running
+    PROGRESS_Q = asyncio.Queue()
+    if PENDING_SNAPSHOT:
+        # Left over from a previous loop; their wakeups went with its queue
+        PROGRESS_Q.put_nowait(next(iter(PENDING_SNAPSHOT)))
+    _writer_running = True
+    try:
+        while True:
+            await PROGRESS_Q.get()
+            await asyncio.sleep(PROGRESS_FLUSH_INTERVAL)
+            while not PROGRESS_Q.empty():
+                PROGRESS_Q.get_nowait()
+
+            pending = list(PENDING_SNAPSHOT.values())
+            PENDING_SNAPSHOT.clear()
+            await asyncio.to_thread(_write_pending, pending)
+    finally:
+        _writer_running = False
 
 
 def save_segmentation_result(job: JobInternal, metadata: Dict[str, Any]) -> None:
     """
     Save the final segmentation output for a job.
     """
-    out_file = get_job_output_dir(job.id) / "result.json"
+    out_file = job_output_dir(job) / "result.json"
     out_file.write_text(json.dumps(metadata, indent=2))
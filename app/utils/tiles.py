@@ -1,22 +1,88 @@
 # app/utils/tiles.py
 from __future__ import annotations
 
-from typing import List, Tuple
+import numpy as np
+from skimage.filters import threshold_otsu
 
 
-def compute_tile_grid(width: int, height: int, tile_size: int, overlap: int = 0) -> List[Tuple[int, int, int, int]]:
+def compute_tile_grid(width: int, height: int, tile_size: int, overlap: int = 0) -> np.ndarray:
     """
-    Return a list of tiles defined as (x, y, w, h).
+    Return an (N, 4) int32 array of tiles defined as (x, y, w, h), row by row.
     This is a simple grid; in a real version we'd align with actual WSI dims.
     """
-    tiles = []
-    y = 0
-    while y < height:
-        x = 0
-        h = min(tile_size, height - y)
-        while x < width:
-            w = min(tile_size, width - x)
-            tiles.append((x, y, w, h))
-            x += tile_size - overlap
-        y += tile_size - overlap
-    return tiles
+    step = tile_size - overlap
+    xs = np.arange(0, width, step, dtype=np.int32)
+    ys = np.arange(0, height, step, dtype=np.int32)
+    x, y = np.meshgrid(xs, ys, indexing="xy")
+    w = np.minimum(tile_size, width - x)
+    h = np.minimum(tile_size, height - y)
+    return np.stack([x, y, w, h], axis=-1).reshape(-1, 4).astype(np.int32, copy=False)
+
+
+def _spread_bits(v: np.ndarray) -> np.ndarray:
+    """Insert a zero bit between each of the low 32 bits of v."""
+    v = v.astype(np.uint64) & np.uint64(0x00000000FFFFFFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+
+def morton_order(tiles: np.ndarray, stride: int) -> np.ndarray:
+    """
+    Return tile indices sorted along a Z-order (Morton) curve over the grid.
+    Consecutive tiles then stay spatially close, so OpenSlide keeps hitting
+    the same decoded JPEG tiles in its cache instead of re-decoding them
+    on every raster row.
+    """
+    boxes = np.asarray(tiles, dtype=np.int64).reshape(-1, 4)
+    keys = _spread_bits(boxes[:, 0] // stride) | (_spread_bits(boxes[:, 1] // stride) << np.uint64(1))
+    return np.argsort(keys, kind="stable")
+
+
+_LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def compute_tissue_mask(low_np: np.ndarray) -> np.ndarray:
+    """Boolean tissue mask of a low-res RGB slide view (tissue is darker)."""
+    # uint8 luminance: 1 B/pixel and Otsu's fast 256-bin histogram path
+    gray = (low_np @ _LUMA_WEIGHTS).astype(np.uint8)
+
+    # Global Otsu threshold. threshold_otsu puts pixels *at* the threshold
+    # in the dark class (only > th is bright), so keep them as tissue;
+    # with `<` a two-level view would come out empty.
+    try:
+        th = threshold_otsu(gray)
+        return gray <= th
+    except Exception:
+        return gray < 217        # fallback threshold (0.85 * 255)
+
+
+def tile_coverage(
+    mask: np.ndarray,
+    tiles: np.ndarray,
+    sx: float,
+    sy: float,
+) -> np.ndarray:
+    """
+    Fraction of each full-resolution tile that is set in a low-resolution
+    boolean `mask`, where (sx, sy) scale full-res to mask coordinates.
+    Every tile covers at least one mask pixel. Uses a summed-area table, so
+    each tile costs O(1) however large it is.
+    """
+    mh, mw = mask.shape
+    sat = np.zeros((mh + 1, mw + 1), dtype=np.int64)
+    np.cumsum(mask, axis=0, out=sat[1:, 1:])
+    np.cumsum(sat[1:, 1:], axis=1, out=sat[1:, 1:])
+
+    boxes = np.asarray(tiles, dtype=np.float64).reshape(-1, 4)
+    x, y, w, h = boxes.T
+    x1 = np.clip(np.floor(x * sx).astype(np.int64), 0, mw - 1)
+    y1 = np.clip(np.floor(y * sy).astype(np.int64), 0, mh - 1)
+    x2 = np.clip(np.ceil((x + w) * sx).astype(np.int64), x1 + 1, mw)
+    y2 = np.clip(np.ceil((y + h) * sy).astype(np.int64), y1 + 1, mh)
+
+    covered = sat[y2, x2] - sat[y1, x2] - sat[y2, x1] + sat[y1, x1]
+    return covered / ((x2 - x1) * (y2 - y1))
@@ -2,7 +2,11 @@
 from __future__ import annotations
 
 import asyncio
-from typing import Dict, List, Tuple, Set
+import logging
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple, Set
 from uuid import uuid4
 
 from app.models import (
@@ -15,57 +19,129 @@ from app.models import (
 )
 
 
+logger = logging.getLogger(__name__)
+
+_FINISHED = (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+
 # ---------- In-memory "DB" + scheduler shared state ----------
 
 WORKFLOWS: Dict[str, WorkflowInternal] = {}
 JOBS: Dict[str, JobInternal] = {}
 # (workflow_id, branch_id) -> ordered list of job_ids
 BRANCH_JOBS: Dict[Tuple[str, str], List[str]] = {}
+# (workflow_id, branch_id) -> index of the first job in that branch that
+# hasn't finished yet; a branch is dropped once all its jobs have finished
+BRANCH_CURSOR: Dict[Tuple[str, str], int] = {}
+# user_id -> ids of that user's workflows / jobs, in creation order
+USER_WORKFLOWS: Dict[str, List[str]] = defaultdict(list)
+USER_JOBS: Dict[str, List[str]] = defaultdict(list)
 
 running_jobs: Set[str] = set()
 active_users: Set[str] = set()
+# user_id -> number of that user's RUNNING jobs (kept in step with running_jobs)
+user_running_counts: Dict[str, int] = defaultdict(int)
+
+# Set whenever a scheduling pass could start something new
+# (workflow created, job finished or cancelled). Created by scheduler_loop
+# on its own event loop: an Event made at import time binds to the first
+# loop that waits on it and fails under any later one.
+scheduler_wakeup: Optional[asyncio.Event] = None
+
+logger.debug("workflow_manager module loaded, id(JOBS) = %d", id(JOBS))
 
-# Global lock for scheduler updates
-scheduler_lock = asyncio.Lock()
 
-print("workflow_manager module loaded, id(JOBS) =", id(JOBS))
+
+def new_scheduler_wakeup() -> asyncio.Event:
+    """Create scheduler_wakeup on the running loop (for scheduler_loop)."""
+    global scheduler_wakeup
+    scheduler_wakeup = asyncio.Event()
+    return scheduler_wakeup
+
+
+def wake_scheduler() -> None:
+    """Request a scheduling pass; a no-op before scheduler_loop starts."""
+    if scheduler_wakeup is not None:
+        scheduler_wakeup.set()
+
 
 # ---------- Conversion helpers ----------
 
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def ns_to_datetime(ns: Optional[int]) -> Optional[datetime]:
+    """Epoch nanoseconds -> aware UTC datetime (microsecond precision)."""
+    if ns is None:
+        return None
+    return _EPOCH + timedelta(microseconds=ns // 1000)
+
+
 def job_to_read(job: JobInternal) -> JobRead:
-    return JobRead(
-        id=job.id,
-        workflow_id=job.workflow_id,
-        branch_id=job.branch_id,
-        user_id=job.user_id,
-        job_type=job.job_type,
-        status=job.status,
-        progress=job.progress,
-        tiles_done=job.tiles_done,
-        tiles_total=job.tiles_total,
-        error=job.error,
-        created_at=job.created_at,
-        started_at=job.started_at,
-        finished_at=job.finished_at,
-    )
+    # Internal state is already well-typed: skip Pydantic validation
+    return JobRead.model_construct(**job_to_dict(job))
+
+
+def job_to_dict(job: JobInternal) -> Dict[str, Any]:
+    """Same fields as JobRead, as a plain dict (no validation)."""
+    return {
+        "id": job.id,
+        "workflow_id": job.workflow_id,
+        "branch_id": job.branch_id,
+        "user_id": job.user_id,
+        "job_type": job.job_type,
+        "status": job.status,
+        "progress": job.progress,
+        "tiles_done": job.tiles_done,
+        "tiles_total": job.tiles_total,
+        "error": job.error,
+        "created_at": ns_to_datetime(job.created_ns),
+        "started_at": ns_to_datetime(job.started_ns),
+        "finished_at": ns_to_datetime(job.finished_ns),
+    }
 
 
 def compute_workflow_progress(wf: WorkflowInternal) -> float:
-    if not wf.job_ids:
+    if not wf._progress_n:
         return 0.0
-    progresses = [JOBS[jid].progress for jid in wf.job_ids]
-    return sum(progresses) / len(progresses)
+    return min(max(wf._progress_sum / wf._progress_n, 0.0), 1.0)
+
+
+def set_job_progress(job: JobInternal, progress: float) -> None:
+    """
+    Set a job's progress and fold the change into its workflow's running
+    sum, so overall_progress never has to revisit every job.
+
+    Once the job is finished the sum is recomputed exactly instead: the
+    per-tile deltas leave rounding error behind, and a workflow whose jobs
+    all succeeded must report exactly 1.0.
+    """
+    wf = WORKFLOWS.get(job.workflow_id)
+    delta = progress - job.progress
+    job.progress = progress
+    if wf is None:
+        return
+    if job.status in _FINISHED:
+        wf._progress_sum = math.fsum(JOBS[jid].progress for jid in wf.job_ids)
+    else:
+        wf._progress_sum += delta
 
 
 def workflow_to_read(wf: WorkflowInternal) -> WorkflowRead:
-    return WorkflowRead(
-        id=wf.id,
-        name=wf.name,
-        user_id=wf.user_id,
-        created_at=wf.created_at,
-        job_ids=wf.job_ids,
-        overall_progress=compute_workflow_progress(wf),
-    )
+    # Internal state is already well-typed: skip Pydantic validation
+    return WorkflowRead.model_construct(**workflow_to_dict(wf))
+
+
+def workflow_to_dict(wf: WorkflowInternal) -> Dict[str, Any]:
+    """Same fields as WorkflowRead, as a plain dict (no validation)."""
+    return {
+        "id": wf.id,
+        "name": wf.name,
+        "user_id": wf.user_id,
+        "created_at": ns_to_datetime(wf.created_ns),
+        "job_ids": wf.job_ids,
+        "overall_progress": compute_workflow_progress(wf),
+    }
 
 
 # ---------- CRUD-style helpers ----------
@@ -74,10 +150,12 @@ def create_workflow(user_id: str, payload: WorkflowCreate) -> WorkflowInternal:
     wf_id = str(uuid4())
     wf = WorkflowInternal(id=wf_id, name=payload.name, user_id=user_id)
     WORKFLOWS[wf_id] = wf
+    USER_WORKFLOWS[user_id].append(wf_id)
 
     for branch in payload.branches:
         key = (wf_id, branch.branch_id)
         BRANCH_JOBS.setdefault(key, [])
+        BRANCH_CURSOR.setdefault(key, 0)
         for job_create in branch.jobs:
             jid = str(uuid4())
             job = JobInternal(
@@ -89,9 +167,12 @@ def create_workflow(user_id: str, payload: WorkflowCreate) -> WorkflowInternal:
                 params=job_create.params,
             )
             JOBS[jid] = job
+            USER_JOBS[user_id].append(jid)
             wf.job_ids.append(jid)
             BRANCH_JOBS[key].append(jid)
 
+    wf._progress_n = len(wf.job_ids)
+    wake_scheduler()
     return wf
 
 
@@ -103,7 +184,11 @@ def get_workflow_for_user(user_id: str, workflow_id: str) -> WorkflowInternal:
 
 
 def list_workflows_for_user(user_id: str) -> List[WorkflowInternal]:
-    return [wf for wf in WORKFLOWS.values() if wf.user_id == user_id]
+    return [WORKFLOWS[wf_id] for wf_id in USER_WORKFLOWS.get(user_id, ())]
+
+
+def list_jobs_for_user(user_id: str) -> List[JobInternal]:
+    return [JOBS[jid] for jid in USER_JOBS.get(user_id, ())]
 
 
 def list_jobs_for_workflow(user_id: str, workflow_id: str) -> List[JobInternal]:
@@ -123,7 +208,9 @@ def cancel_pending_job(user_id: str, job_id: str) -> JobInternal:
     if job.status != JobStatus.PENDING:
         raise ValueError("Only PENDING jobs can be cancelled")
     job.status = JobStatus.CANCELLED
-    job.progress = 0.0
+    set_job_progress(job, 0.0)
     job.tiles_done = 0
     job.tiles_total = 0
+    # Later jobs in the branch may now be runnable
+    wake_scheduler()
     return job
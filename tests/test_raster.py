@@ -0,0 +1,102 @@
+# tests/test_raster.py
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from app.utils import raster
+from app.utils.raster import rasterize_boxes
+
+
+def _random_case(rng):
+    # Small images and boxes that often hang off the edges or miss the
+    # image entirely, with a mix of sparse and dense layouts
+    width, height = rng.integers(1, 80, size=2)
+    n = rng.integers(0, 40)
+    x1 = rng.integers(-20, width + 20, size=n)
+    y1 = rng.integers(-20, height + 20, size=n)
+    x2 = x1 + rng.integers(0, max(width // 2, 1) + 1, size=n)
+    y2 = y1 + rng.integers(0, max(height // 2, 1) + 1, size=n)
+    return int(width), int(height), x1, y1, x2, y2
+
+
+def _draw_reference(width, height, x1, y1, x2, y2):
+    img = Image.new("L", (width, height), 0)
+    draw = ImageDraw.Draw(img)
+    for box in zip(x1.tolist(), y1.tolist(), x2.tolist(), y2.tolist()):
+        draw.rectangle([box[:2], box[2:]], fill=255)
+    return np.asarray(img)
+
+
+@pytest.mark.parametrize("path", ["numba", "numpy"])
+def test_rasterize_boxes_matches_imagedraw(path, monkeypatch):
+    fills = []
+    if path == "numpy":
+        monkeypatch.setattr(raster, "njit", None)
+    else:
+        if raster.njit is None:
+            pytest.skip("numba not installed")
+        fill = raster._fill_boxes
+        monkeypatch.setattr(raster, "_fill_boxes", lambda *a: fills.append(1) or fill(*a))
+
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        width, height, x1, y1, x2, y2 = _random_case(rng)
+        mask = rasterize_boxes(x1, y1, x2, y2, width, height)
+        expected = _draw_reference(width, height, x1, y1, x2, y2)
+        np.testing.assert_array_equal(mask, expected, err_msg=f"{width}x{height} {len(x1)} boxes")
+
+    if path == "numba":
+        # Sparse cases must actually take the kernel, not the fallback
+        assert len(fills) > 100
+
+
+def test_fill_kernel_from_two_threads():
+    # Overlay rendering calls the kernel from asyncio.to_thread workers,
+    # sometimes for two jobs at once
+    if raster.njit is None:
+        pytest.skip("numba not installed")
+    rng = np.random.default_rng(1)
+    cases = [_random_case(rng) for _ in range(50)]
+    errors = []
+
+    def render():
+        try:
+            for width, height, x1, y1, x2, y2 in cases:
+                mask = np.zeros((height, width), dtype=np.uint8)
+                inside = (x2 >= 0) & (y2 >= 0) & (x1 < width) & (y1 < height)
+                bx1 = np.clip(x1[inside], 0, width - 1)
+                by1 = np.clip(y1[inside], 0, height - 1)
+                bx2 = np.clip(x2[inside], 0, width - 1) + 1
+                by2 = np.clip(y2[inside], 0, height - 1) + 1
+                raster._fill_boxes(bx1, by1, bx2, by2, mask)
+                expected = _draw_reference(width, height, x1, y1, x2, y2)
+                np.testing.assert_array_equal(mask, expected)
+        except Exception as exc:  # surfaced in the main thread below
+            errors.append(exc)
+
+    threads = [threading.Thread(target=render) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=60)
+    assert not any(t.is_alive() for t in threads)
+    assert not errors, errors
+
+
+def test_interpreter_exits_after_threaded_rasterize():
+    # A parallel Numba kernel launched off the main thread used to keep
+    # the process from exiting
+    code = (
+        "import threading, numpy as np\n"
+        "from app.utils.raster import rasterize_boxes\n"
+        "a = np.array([1, 5]); b = np.array([3, 9])\n"
+        "t = threading.Thread(target=rasterize_boxes, args=(a, a, b, b, 64, 64))\n"
+        "t.start(); t.join()\n"
+    )
+    repo = Path(__file__).resolve().parents[1]
+    subprocess.run([sys.executable, "-c", code], cwd=repo, check=True, timeout=120)
@@ -0,0 +1,195 @@
+# tests/test_scheduler.py
+import asyncio
+
+import pytest
+
+import app.scheduler_core as sc
+import app.workflow_manager as wm
+from app.models import JobStatus, WorkflowCreate
+
+
+@pytest.fixture(autouse=True)
+def scheduler_state(monkeypatch, tmp_path):
+    # Fresh in-memory state per test; progress.json sidecars go to tmp_path
+    monkeypatch.chdir(tmp_path)
+    for table in (
+        wm.WORKFLOWS, wm.JOBS, wm.BRANCH_JOBS, wm.BRANCH_CURSOR,
+        wm.USER_WORKFLOWS, wm.USER_JOBS,
+        wm.running_jobs, wm.active_users, wm.user_running_counts,
+    ):
+        table.clear()
+    monkeypatch.setattr(sc, "MAX_WORKERS", 10)
+    monkeypatch.setattr(sc, "MAX_ACTIVE_USERS", 10)
+
+
+class GatedBodies:
+    """Stub run_job_body: each job runs until the test releases it."""
+
+    def __init__(self, monkeypatch):
+        self.started = []
+        self.gates = {}
+        monkeypatch.setattr(sc, "run_job_body", self._body)
+
+    async def _body(self, job):
+        self.started.append(job.id)
+        gate = self.gates[job.id] = asyncio.Event()
+        await gate.wait()
+
+    async def finish(self, job_id):
+        self.gates[job_id].set()
+        await _settle()
+
+
+async def _settle():
+    # Let execute_job tasks run to their next await (or to completion)
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def _workflow(user_id, *branches):
+    payload = WorkflowCreate(name="wf", branches=[
+        {"branch_id": f"b{i}", "jobs": [{"job_type": "tissue_mask"}] * n}
+        for i, n in enumerate(branches)
+    ])
+    wf = wm.create_workflow(user_id, payload)
+    return [wm.BRANCH_JOBS[(wf.id, f"b{i}")] for i in range(len(branches))]
+
+
+def _statuses(job_ids):
+    return [wm.JOBS[j].status for j in job_ids]
+
+
+async def _pass():
+    await sc.schedule_once()
+    await _settle()
+
+
+def test_branches_run_serially_and_in_order(monkeypatch):
+    bodies = GatedBodies(monkeypatch)
+
+    async def scenario():
+        (a, b) = _workflow("u", 3, 1)
+        await _pass()
+        # Heads of both branches start; the rest of branch a waits
+        assert bodies.started == [a[0], b[0]]
+        assert _statuses(a) == [JobStatus.RUNNING, JobStatus.PENDING, JobStatus.PENDING]
+
+        await _pass()
+        assert bodies.started == [a[0], b[0]]
+
+        for i in range(3):
+            await bodies.finish(a[i])
+            await _pass()
+        await bodies.finish(b[0])
+        await _pass()
+
+        assert bodies.started == [a[0], b[0], a[1], a[2]]
+        assert set(_statuses(a + b)) == {JobStatus.SUCCEEDED}
+        # Finished branches leave the cursor table
+        assert wm.BRANCH_CURSOR == {}
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_pending_jobs_are_skipped(monkeypatch):
+    bodies = GatedBodies(monkeypatch)
+
+    async def scenario():
+        (a,) = _workflow("u", 4)
+        # At the cursor: the branch head is cancelled before any pass
+        wm.cancel_pending_job("u", a[0])
+        await _pass()
+        assert bodies.started == [a[1]]
+
+        # Behind the cursor: a later job is cancelled while a[1] runs
+        wm.cancel_pending_job("u", a[2])
+        await bodies.finish(a[1])
+        await _pass()
+        assert bodies.started == [a[1], a[3]]
+
+        await bodies.finish(a[3])
+        await _pass()
+        assert _statuses(a) == [
+            JobStatus.CANCELLED, JobStatus.SUCCEEDED,
+            JobStatus.CANCELLED, JobStatus.SUCCEEDED,
+        ]
+
+    asyncio.run(scenario())
+
+
+def test_max_active_users_skips_new_users_only(monkeypatch):
+    monkeypatch.setattr(sc, "MAX_ACTIVE_USERS", 2)
+    bodies = GatedBodies(monkeypatch)
+
+    async def scenario():
+        (u0a, u0b) = _workflow("u0", 1, 1)
+        (u1,) = _workflow("u1", 1)
+        (u2,) = _workflow("u2", 1)
+        await _pass()
+        # u0's second branch still starts: only *new* users are capped
+        assert bodies.started == [u0a[0], u0b[0], u1[0]]
+        assert _statuses(u2) == [JobStatus.PENDING]
+
+        await bodies.finish(u1[0])
+        await _pass()
+        assert bodies.started[-1] == u2[0]
+        assert wm.active_users == {"u0", "u2"}
+
+    asyncio.run(scenario())
+
+
+def test_max_workers_caps_running_jobs(monkeypatch):
+    monkeypatch.setattr(sc, "MAX_WORKERS", 2)
+    bodies = GatedBodies(monkeypatch)
+
+    async def scenario():
+        branches = _workflow("u", 1, 1, 1)
+        await _pass()
+        assert len(bodies.started) == 2
+        assert len(wm.running_jobs) == 2
+
+        await bodies.finish(bodies.started[0])
+        await _pass()
+        assert bodies.started == [b[0] for b in branches]
+
+    asyncio.run(scenario())
+
+
+def test_all_succeeded_workflow_reports_exactly_one(monkeypatch):
+    async def body(job):
+        # Many small per-tile deltas, as a real segmentation job produces
+        for done in range(1, 1538):
+            wm.set_job_progress(job, done / 1537)
+
+    monkeypatch.setattr(sc, "run_job_body", body)
+
+    async def scenario():
+        _workflow("u", 5)
+        for _ in range(5):
+            await _pass()
+        wf = next(iter(wm.WORKFLOWS.values()))
+        assert set(_statuses(wf.job_ids)) == {JobStatus.SUCCEEDED}
+        assert wm.compute_workflow_progress(wf) == 1.0
+
+    asyncio.run(scenario())
+
+
+def test_scheduler_loop_survives_a_new_event_loop(monkeypatch):
+    # The wakeup Event must not stay bound to the first loop that ran it
+    async def body(job):
+        await asyncio.sleep(0)
+
+    monkeypatch.setattr(sc, "run_job_body", body)
+
+    async def session():
+        loop_task = asyncio.create_task(sc.scheduler_loop())
+        (a,) = _workflow("u", 2)
+        for _ in range(200):
+            if set(_statuses(a)) == {JobStatus.SUCCEEDED}:
+                break
+            await asyncio.sleep(0.01)
+        loop_task.cancel()
+        return _statuses(a)
+
+    for _ in range(2):
+        assert asyncio.run(session()) == [JobStatus.SUCCEEDED] * 2
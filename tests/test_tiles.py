@@ -0,0 +1,55 @@
+# tests/test_tiles.py
+import numpy as np
+
+from app.utils.tiles import compute_tile_grid, morton_order
+
+
+# Reference versions: the original nested-loop grid and Python-sorted
+# Morton order that the NumPy versions replaced
+
+def _grid_loops(width, height, tile_size, overlap):
+    tiles = []
+    y = 0
+    while y < height:
+        x = 0
+        h = min(tile_size, height - y)
+        while x < width:
+            w = min(tile_size, width - x)
+            tiles.append((x, y, w, h))
+            x += tile_size - overlap
+        y += tile_size - overlap
+    return tiles
+
+
+def _spread_bits(v):
+    v &= 0x00000000FFFFFFFF
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+    v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v << 2)) & 0x3333333333333333
+    v = (v | (v << 1)) & 0x5555555555555555
+    return v
+
+
+def _morton_sorted(tiles, stride):
+    def key(i):
+        x, y, _, _ = tiles[i]
+        return _spread_bits(x // stride) | (_spread_bits(y // stride) << 1)
+
+    return sorted(range(len(tiles)), key=key)
+
+
+def test_grid_and_morton_match_reference():
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        tile_size = int(rng.integers(1, 600))
+        overlap = int(rng.integers(0, tile_size))
+        step = tile_size - overlap
+        width, height = (int(v) for v in rng.integers(1, 40 * step + tile_size, size=2))
+
+        grid = compute_tile_grid(width, height, tile_size, overlap)
+        expected = _grid_loops(width, height, tile_size, overlap)
+        assert grid.dtype == np.int32
+        assert [tuple(t) for t in grid.tolist()] == expected
+
+        assert morton_order(grid, step).tolist() == _morton_sorted(expected, step)
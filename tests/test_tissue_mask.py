@@ -0,0 +1,29 @@
+# tests/test_tissue_mask.py
+import numpy as np
+
+from app.utils.tiles import compute_tissue_mask
+
+
+def test_two_level_view_keeps_tissue():
+    # Dark tissue block on a light background: exactly two grey levels,
+    # so Otsu's threshold lands on the tissue level itself
+    low = np.full((40, 60, 3), 230, dtype=np.uint8)
+    low[10:30, 5:25] = (150, 90, 160)
+
+    mask = compute_tissue_mask(low)
+
+    expected = np.zeros((40, 60), dtype=bool)
+    expected[10:30, 5:25] = True
+    np.testing.assert_array_equal(mask, expected)
+
+
+def test_noisy_bimodal_view():
+    rng = np.random.default_rng(0)
+    low = rng.normal(225, 6, size=(64, 64, 3))
+    low[16:48, 16:48] = rng.normal(120, 15, size=(32, 32, 3))
+    low = np.clip(low, 0, 255).astype(np.uint8)
+
+    mask = compute_tissue_mask(low)
+
+    assert mask[16:48, 16:48].mean() > 0.99
+    assert mask[:16].mean() < 0.01